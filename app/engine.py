@@ -1,45 +1,100 @@
 from __future__ import annotations
 
+import string
+from collections import OrderedDict
 from datetime import datetime, timezone
+from threading import Lock
 from typing import TYPE_CHECKING
 
-from app.models import Decision, DecisionResponse, NotificationEvent, RuleConfig
+from app.models import Decision, DecisionResponse, NotificationEvent, NotificationEventCore, RuleConfig
 from app.store import utc_now
 
 if TYPE_CHECKING:
-    from app.store import InMemoryStore
+    from collections.abc import Sequence
 
+    from app.store import InMemoryStore, RecentFingerprint, TokenVocabulary
 
-def normalized_text(text: str | None) -> str:
-    """Normalize text for near-duplicate detection."""
-    if not text:
-        return ""
-    return text.lower().strip()
 
+# One C-level pass: ASCII punctuation becomes a token boundary, ASCII upper case is lowered.
+_NORMALIZE_TABLE = str.maketrans(
+    {**{c: " " for c in string.punctuation}, **{c: c.lower() for c in string.ascii_uppercase}}
+)
 
-def token_fingerprint(text: str) -> str:
-    """Create a fingerprint from tokens for near-duplicate detection."""
+
+def normalized_text(text: str | None) -> str:
+    """Normalize text for near-duplicate detection."""
     if not text:
         return ""
-    tokens = set(normalized_text(text).split())
-    sorted_tokens = sorted(tokens)
-    combined = "|".join(sorted_tokens)
-    return combined  # Return the token string, not the hash  
-
-
-def jaccard_similarity(fp1: str, fp2: str) -> float:
-    """Calculate Jaccard similarity between two token fingerprints."""
-    if not fp1 or not fp2:
-        return 0.0
-    tokens1 = set(fp1.split("|"))
-    tokens2 = set(fp2.split("|"))
-    if not tokens1 and not tokens2:
-        return 1.0
-    if not tokens1 or not tokens2:
-        return 0.0
-    intersection = len(tokens1 & tokens2)
-    union = len(tokens1 | tokens2)
-    return intersection / union if union > 0 else 0.0
+    text = text.translate(_NORMALIZE_TABLE)
+    if not text.isascii():
+        # The table only covers ASCII; fall back to full Unicode lowering.
+        text = text.lower()
+    return text.strip()
+
+
+# Jaccard threshold for near duplicates, as an integer percent for exact bound checks.
+NEAR_DUPLICATE_PERCENT = 82
+
+
+class _FingerprintCache:
+    """LRU of text -> (fingerprint, vocabulary generation it was last valid at).
+
+    A hit at the current generation is returned as is. After a reassignment the
+    entry's bits are checked once, so only fingerprints whose own bits were
+    reassigned are recomputed.
+    """
+
+    def __init__(self, vocabulary: TokenVocabulary, maxsize: int = 4096) -> None:
+        self._vocabulary = vocabulary
+        self._maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, text: str) -> int:
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is not None:
+                self._entries.move_to_end(text)
+        if entry is not None:
+            fp, generation = entry
+            # Unlocked read: a reassignment racing with it is caught on the next hit.
+            if generation == self._vocabulary.generation:
+                return fp
+            generation = self._vocabulary.revalidate(fp, generation)
+            if generation is not None:
+                with self._lock:
+                    if text in self._entries:
+                        self._entries[text] = (fp, generation)
+                return fp
+        entry = self._vocabulary.fingerprint_at(normalized_text(text).split())
+        with self._lock:
+            self._entries[text] = entry
+            self._entries.move_to_end(text)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        return entry[0]
+
+
+def first_near_duplicate(
+    fp: int, type_id: int, candidates: Sequence[RecentFingerprint]
+) -> RecentFingerprint | None:
+    """Return the first candidate with ``type_id`` within the near-duplicate threshold."""
+    pct = NEAR_DUPLICATE_PERCENT
+    fp_size = fp.bit_count()
+    # Size bound: Jaccard >= t needs t*|a| <= |b| <= |a|/t
+    min_size_scaled = pct * fp_size
+    max_size_scaled = fp_size * 100
+    for candidate in candidates:
+        if candidate.type_id != type_id:
+            continue
+        other_size = candidate.size
+        if other_size * 100 < min_size_scaled or pct * other_size > max_size_scaled:
+            continue
+        # Overlap bound: |a & b| >= t/(1+t) * (|a| + |b|)
+        overlap = (fp & candidate.fingerprint).bit_count()
+        if overlap * (100 + pct) >= pct * (fp_size + other_size):
+            return candidate
+    return None
 
 
 class PrioritizationEngine:
@@ -47,10 +102,19 @@ class PrioritizationEngine:
 
     def __init__(self, store: InMemoryStore) -> None:
         self.store = store
+        self._fingerprints = _FingerprintCache(store.vocabulary)
 
-    def decide(self, event: NotificationEvent) -> DecisionResponse:
+    def decide(self, event: NotificationEvent | NotificationEventCore) -> DecisionResponse:
         """Process a notification event and return a decision."""
+        if isinstance(event, NotificationEvent):
+            event = NotificationEventCore.from_pydantic(event)
+        # Hold the user's shard lock so the check-then-record steps below are atomic.
+        with self.store.locked(event.user_id):
+            return self._decide(event)
+
+    def _decide(self, event: NotificationEventCore) -> DecisionResponse:
         rules = self.store.get_rules()
+        suppress_types, promo_types, urgent_types = self.store.rule_sets()
         now = utc_now()
 
         # 1. Check if event is expired
@@ -64,7 +128,7 @@ class PrioritizationEngine:
             )
 
         # 2. Check if event type is in suppress list
-        if event.event_type in rules.suppress_event_types:
+        if event.event_type in suppress_types:
             return DecisionResponse(
                 decision=Decision.NEVER,
                 reason="event_type_suppressed",
@@ -75,7 +139,9 @@ class PrioritizationEngine:
 
         # 3. Check for exact duplicates
         if event.dedupe_key:
-            if self.store.exact_seen_within(event.user_id, event.dedupe_key, rules.cooldown_seconds):
+            if self.store.exact_seen_within(
+                event.user_id, event.dedupe_key, rules.cooldown_seconds, now
+            ):
                 return DecisionResponse(
                     decision=Decision.NEVER,
                     reason="exact_duplicate",
@@ -87,10 +153,9 @@ class PrioritizationEngine:
             self.store.mark_exact_seen(event.user_id, event.dedupe_key, now)
 
         # 4. Check promotional daily cap
-        if event.event_type in rules.promotional_event_types:
-            recent = self.store.recent_events(event.user_id, within_seconds=86400)  # 24 hours
-            promo_count = sum(
-                1 for e in recent if e.event_type in rules.promotional_event_types
+        if event.event_type in promo_types:
+            promo_count = self.store.promo_count_within(
+                event.user_id, 86400, rules.promotional_cap_per_day, now  # 24 hours
             )
             if promo_count >= rules.promotional_cap_per_day:
                 return DecisionResponse(
@@ -102,35 +167,37 @@ class PrioritizationEngine:
                 )
 
         # 5. Check for near duplicates
-        is_urgent = event.event_type in rules.urgent_event_types
-        if not is_urgent:
-            # Create fingerprint for near-duplicate detection
-            combined_text = f"{event.title or ''} {event.message or ''}"
-            fp = token_fingerprint(combined_text)
+        is_urgent = event.event_type in urgent_types
+        if not is_urgent and (event.title or event.message):
+            # Create fingerprint for near-duplicate detection; single-field payloads
+            # (the common push case) are fingerprinted without building a new string.
+            title, message = event.title, event.message
+            combined_text = message if not title else (title if not message else f"{title} {message}")
+            fp = self._fingerprints.get(combined_text)
 
             if fp:
-                recent_fps = self.store.recent_fingerprints(
-                    event.user_id, within_seconds=rules.near_duplicate_window_seconds
+                recent_fps = self.store.candidate_fingerprints(
+                    event.user_id, fp, within_seconds=rules.near_duplicate_window_seconds, now=now
                 )
-                for recent_fp in recent_fps:
-                    if recent_fp.event.event_type == event.event_type:
-                        similarity = jaccard_similarity(fp, recent_fp.fingerprint)
-                        if similarity >= 0.82:
-                            return DecisionResponse(
-                                decision=Decision.LATER,
-                                reason="near_duplicate",
-                                scheduled_for=now,  # Will be digested later
-                                policy_version=rules.policy_version,
-                                risk_score=0.5,
-                            )
+                type_id = self.store.event_type_id(event.event_type)
+                if first_near_duplicate(fp, type_id, recent_fps) is not None:
+                    return DecisionResponse(
+                        decision=Decision.LATER,
+                        reason="near_duplicate",
+                        scheduled_for=now,  # Will be digested later
+                        policy_version=rules.policy_version,
+                        risk_score=0.5,
+                    )
 
             # Store this fingerprint for future near-duplicate detection
             self.store.push_fingerprint(event.user_id, fp, event, now)
 
-        # 6. Check hourly rate limit (only for non-urgent events)
+        # 6 + 7. Hourly rate limit and per-channel cooldown (only for non-urgent)
         if not is_urgent:
-            recent = self.store.recent_events(event.user_id, within_seconds=3600)  # 1 hour
-            if len(recent) >= rules.max_per_hour:
+            hourly, channel_hit = self.store.scan_for_limits(
+                event.user_id, 3600, rules.cooldown_seconds, event.channel, rules.max_per_hour, now
+            )
+            if hourly >= rules.max_per_hour:
                 return DecisionResponse(
                     decision=Decision.LATER,
                     reason="hourly_rate_limit_exceeded",
@@ -138,24 +205,17 @@ class PrioritizationEngine:
                     policy_version=rules.policy_version,
                     risk_score=0.3,
                 )
-
-        # 7. Check per-channel cooldown (only for non-urgent)
-        if not is_urgent:
-            recent = self.store.recent_events(
-                event.user_id, within_seconds=rules.cooldown_seconds
-            )
-            for r in recent:
-                if r.channel == event.channel:
-                    return DecisionResponse(
-                        decision=Decision.LATER,
-                        reason="channel_cooldown_active",
-                        scheduled_for=now,
-                        policy_version=rules.policy_version,
-                        risk_score=0.2,
-                    )
+            if channel_hit:
+                return DecisionResponse(
+                    decision=Decision.LATER,
+                    reason="channel_cooldown_active",
+                    scheduled_for=now,
+                    policy_version=rules.policy_version,
+                    risk_score=0.2,
+                )
 
         # All checks passed - deliver now
-        self.store.add_event(event)
+        self.store.add_event(event, now)
         return DecisionResponse(
             decision=Decision.NOW,
             reason="passed_all_checks",
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import asyncio
+from collections.abc import Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Any
 
-from fastapi import FastAPI
+import orjson
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import FileResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
+from pydantic import TypeAdapter, ValidationError
 
 from app.engine import PrioritizationEngine
-from app.models import DecisionResponse, NotificationEvent, RuleConfig, UserHistory
+from app.models import DecisionResponse, NotificationEvent, NotificationEventCore, RuleConfig, UserHistory
 from app.store import InMemoryStore
 
 app = FastAPI(title="Notification Prioritization Engine", version="0.1.0")
@@ -50,15 +58,110 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
-@app.post("/v1/notifications/decide", response_model=DecisionResponse)
-def decide_notification(event: NotificationEvent) -> DecisionResponse:
-    ai_hint = _safe_ai_hint(event)
-    decision = engine.decide(event)
+# Wire alias -> field name, resolved once from the model instead of per request.
+_ALIAS_MAP = {f.alias: name for name, f in NotificationEvent.model_fields.items() if f.alias}
+# Field name -> wire alias, so error locations match what the client sent.
+_FIELD_ALIASES = {name: alias for alias, name in _ALIAS_MAP.items()}
+_REQUIRED_EVENT_FIELDS = ("user_id", "event_type", "timestamp", "channel")
+_STRING_EVENT_FIELDS = (
+    "user_id",
+    "event_type",
+    "channel",
+    "title",
+    "message",
+    "source",
+    "priority_hint",
+)
+_MAX_DEDUPE_KEY_LENGTH = 256
+_DATETIME_ADAPTER = TypeAdapter(datetime)
+
+
+def _invalid(field: str, msg: str, error_type: str = "value_error") -> RequestValidationError:
+    loc = ("body", _FIELD_ALIASES.get(field, field))
+    return RequestValidationError([{"type": error_type, "loc": loc, "msg": msg}])
+
+
+def _parse_datetime(field: str, value: Any) -> datetime:
+    # Same rules as model validation: ISO strings, numeric strings, s/ms epochs.
+    try:
+        return _DATETIME_ADAPTER.validate_python(value)
+    except ValidationError as exc:
+        loc = ("body", _FIELD_ALIASES.get(field, field))
+        raise RequestValidationError(
+            [{**err, "loc": loc + err["loc"]} for err in exc.errors(include_url=False)]
+        ) from None
+
+
+def _parse_event(body: bytes) -> NotificationEvent:
+    """Build a NotificationEvent from raw JSON, checking only what the engine relies on."""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error"}]
+        ) from None
+    if not isinstance(data, dict):
+        raise RequestValidationError(
+            [{"type": "model_attributes_type", "loc": ("body",), "msg": "Input should be an object"}]
+        )
+    for key in list(data):
+        name = _ALIAS_MAP.get(key)
+        if name is not None:
+            data[name] = data.pop(key)
+    for name in _REQUIRED_EVENT_FIELDS:
+        if data.get(name) is None:
+            raise _invalid(name, "Field required", "missing")
+    for name in _STRING_EVENT_FIELDS:
+        value = data.get(name)
+        if value is not None and not isinstance(value, str):
+            raise _invalid(name, "Input should be a valid string", "string_type")
+    if "metadata" in data and not isinstance(data["metadata"], dict):
+        raise _invalid("metadata", "Input should be a valid dictionary", "dict_type")
+    data["timestamp"] = _parse_datetime("timestamp", data["timestamp"])
+    if data.get("expires_at") is not None:
+        data["expires_at"] = _parse_datetime("expires_at", data["expires_at"])
+    dedupe_key = data.get("dedupe_key")
+    if dedupe_key is not None and (
+        not isinstance(dedupe_key, str) or len(dedupe_key) > _MAX_DEDUPE_KEY_LENGTH
+    ):
+        raise _invalid("dedupe_key", f"Should be a string of at most {_MAX_DEDUPE_KEY_LENGTH} characters")
+    return NotificationEvent.model_construct(**data)
+
+
+class NotificationEventRoute(APIRoute):
+    """Route that parses the body with orjson and skips full Pydantic validation.
+
+    The endpoint signature still drives the OpenAPI schema; at runtime the handler
+    receives a ``NotificationEvent`` built by ``_parse_event``.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        endpoint = self.endpoint
+
+        async def handler(request: Request) -> Response:
+            event = _parse_event(await request.body())
+            result = await endpoint(event)
+            return Response(result.model_dump_json(), media_type="application/json")
+
+        return handler
+
+
+decide_router = APIRouter(route_class=NotificationEventRoute)
+
+
+@decide_router.post("/v1/notifications/decide", response_model=DecisionResponse)
+async def decide_notification(event: NotificationEvent) -> DecisionResponse:
+    ai_hint = await _safe_ai_hint(event)
+    # decide() blocks on the user's shard lock; keep it off the event loop.
+    decision = await run_in_threadpool(engine.decide, NotificationEventCore.from_pydantic(event))
     if ai_hint:
         decision.reason = f"{decision.reason};{ai_hint}"
     return decision
 
 
+app.include_router(decide_router)
+
+
 @app.get("/v1/rules", response_model=RuleConfig)
 def get_rules() -> RuleConfig:
     return store.get_rules()
@@ -73,7 +176,9 @@ def update_rules(rules: RuleConfig) -> RuleConfig:
 def user_history(user_id: str) -> UserHistory:
     return UserHistory(
         user_id=user_id,
-        last_hour_events=store.recent_events(user_id, within_seconds=3600),
+        last_hour_events=[
+            ev.to_pydantic() for ev in store.recent_events(user_id, within_seconds=3600)
+        ],
         audit_records=store.recent_audit(user_id, limit=100),
     )
 
@@ -83,15 +188,23 @@ def metrics_snapshot() -> dict[str, int | str | datetime]:
     rules = store.get_rules()
     return {
         "policy_version": rules.policy_version,
-        "users_tracked": len(store._events_by_user),
-        "audit_users": len(store._audit_by_user),
+        "users_tracked": store.tracked_user_count(),
+        "audit_users": store.audit_user_count(),
     }
 
 
-def _safe_ai_hint(event: NotificationEvent) -> str | None:
-    fut = executor.submit(advisor.suggest, event)
+async def _safe_ai_hint(event: NotificationEvent) -> str | None:
+    # Disabled advisor: skip the executor round-trip entirely.
+    if not advisor.enabled:
+        return None
+    if advisor.timeout_ms <= 0:
+        return "ai_unavailable_timeout_fallback_to_rules"
+    loop = asyncio.get_running_loop()
     try:
-        return fut.result(timeout=advisor.timeout_ms / 1000)
+        return await asyncio.wait_for(
+            loop.run_in_executor(executor, advisor.suggest, event),
+            timeout=advisor.timeout_ms / 1000,
+        )
     except TimeoutError:
         return "ai_unavailable_timeout_fallback_to_rules"
     except Exception:
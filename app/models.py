@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from typing import Any
@@ -29,6 +30,46 @@ class NotificationEvent(BaseModel):
     model_config = {"populate_by_name": True}
 
 
+@dataclass(slots=True, frozen=True)
+class NotificationEventCore:
+    """Lightweight copy of the event fields the engine and store actually read."""
+
+    user_id: str
+    event_type: str
+    channel: str
+    timestamp: datetime
+    dedupe_key: str | None = None
+    expires_at: datetime | None = None
+    title: str | None = None
+    message: str | None = None
+
+    @classmethod
+    def from_pydantic(cls, event: NotificationEvent) -> NotificationEventCore:
+        return cls(
+            user_id=event.user_id,
+            event_type=event.event_type,
+            channel=event.channel,
+            timestamp=event.timestamp,
+            dedupe_key=event.dedupe_key,
+            expires_at=event.expires_at,
+            title=event.title,
+            message=event.message,
+        )
+
+    def to_pydantic(self) -> NotificationEvent:
+        """Rebuild an API model; fields not kept on the core (source, metadata, ...) are defaulted."""
+        return NotificationEvent.model_construct(
+            user_id=self.user_id,
+            event_type=self.event_type,
+            channel=self.channel,
+            timestamp=self.timestamp,
+            dedupe_key=self.dedupe_key,
+            expires_at=self.expires_at,
+            title=self.title,
+            message=self.message,
+        )
+
+
 class DecisionResponse(BaseModel):
     decision: Decision
     reason: str
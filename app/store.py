@@ -1,92 +1,548 @@
 from __future__ import annotations
 
-from collections import defaultdict, deque
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from heapq import heappop, heappush
+from itertools import count
+from operator import attrgetter
+from threading import Lock, RLock
 
-from app.models import AuditRecord, NotificationEvent, RuleConfig
+from app.models import AuditRecord, NotificationEventCore, RuleConfig
 
 
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
 
+# Full events (title, message, ...) are kept this long for the history UI; older
+# history is reassembled from the event columns.
+_FULL_EVENT_RETENTION = timedelta(hours=1)
+
+# Window the promotional daily cap is counted over.
+_PROMO_WINDOW = timedelta(days=1)
+
+# Hard cap on fingerprint width: beyond it, new tokens reuse unreferenced bits.
+_MAX_TOKEN_IDS = 4096
+
+# Window fingerprints are kept for near-duplicate lookups.
+_FINGERPRINT_RETENTION = timedelta(hours=6)
+
+# Number of user shards; must be a power of two.
+_SHARD_COUNT = 32
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _epoch_us(dt: datetime) -> int:
+    """Exact integer microseconds since the epoch of an aware datetime, for sorted timestamp arrays."""
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _bit_positions(fingerprint: int) -> Iterator[int]:
+    """Yield the token ids (set bit positions) of a fingerprint bitmask."""
+    while fingerprint:
+        low = fingerprint & -fingerprint
+        yield low.bit_length() - 1
+        fingerprint ^= low
+
+
+class TokenVocabulary:
+    """Token -> bit position map for fingerprint bitmasks, with live-reference counts.
+
+    Fingerprints are at most ``max_ids`` bits wide. A bit is only handed to a new
+    token once no stored fingerprint uses it: past ``max_ids`` new tokens take the
+    least recently used unreferenced bit, and when every bit is live the oldest
+    tracked fingerprints are evicted to free one.
+    """
+
+    def __init__(self, max_ids: int = _MAX_TOKEN_IDS) -> None:
+        self._lock = Lock()
+        self._max_ids = max_ids
+        self._ids: dict[str, int] = {}
+        self._tokens: list[str] = []
+        self._refs: list[int] = []
+        # Generation at which each id was last handed to a different token.
+        self._reassigned_at: list[int] = []
+        # Unreferenced ids, least recently used first.
+        self._free: OrderedDict[int, None] = OrderedDict()
+        # Stored fingerprints holding references, oldest first.
+        self._live: deque[RecentFingerprint] = deque()
+        # Bumped whenever a bit is reassigned to a different token.
+        self.generation = 0
+
+    def fingerprint(self, tokens: Iterable[str]) -> int:
+        return self.fingerprint_at(tokens)[0]
+
+    def fingerprint_at(self, tokens: Iterable[str]) -> tuple[int, int]:
+        """Return the fingerprint together with the generation it is valid for.
+
+        Tokens beyond the first ``max_ids`` distinct ones are left out of the mask.
+        """
+        fp = 0
+        with self._lock:
+            for token in tokens:
+                token_id = self._ids.get(token)
+                if token_id is None:
+                    token_id = self._allocate(token, fp)
+                    if token_id is None:
+                        continue
+                elif token_id in self._free:
+                    self._free.move_to_end(token_id)
+                fp |= 1 << token_id
+            return fp, self.generation
+
+    def revalidate(self, fingerprint: int, generation: int) -> int | None:
+        """Return the current generation if no bit of ``fingerprint`` was reassigned since ``generation``.
+
+        Callers skip this while ``generation`` is still current. Bits the fingerprint
+        holds that are free are marked recently used.
+        """
+        with self._lock:
+            free = self._free
+            for token_id in _bit_positions(fingerprint):
+                if self._reassigned_at[token_id] > generation:
+                    return None
+                if token_id in free:
+                    free.move_to_end(token_id)
+            return self.generation
+
+    def _allocate(self, token: str, fp: int) -> int | None:
+        if len(self._tokens) < self._max_ids:
+            token_id = len(self._tokens)
+            self._tokens.append(token)
+            self._refs.append(0)
+            self._reassigned_at.append(0)
+        else:
+            free = self._free
+            token_id = next((i for i in free if not fp >> i & 1), None)
+            while token_id is None:
+                if not self._live:
+                    return None
+                self._untrack(self._live.popleft())
+                token_id = next((i for i in free if not fp >> i & 1), None)
+            del free[token_id]
+            del self._ids[self._tokens[token_id]]
+            self._tokens[token_id] = token
+            self.generation += 1
+            self._reassigned_at[token_id] = self.generation
+        self._ids[token] = token_id
+        self._free[token_id] = None
+        return token_id
+
+    def retain(self, fingerprint: int) -> None:
+        with self._lock:
+            self._retain(fingerprint)
+
+    def release(self, fingerprint: int) -> None:
+        with self._lock:
+            self._release(fingerprint)
+
+    def track(self, record: RecentFingerprint) -> None:
+        """Retain a stored fingerprint's bits until it expires or is evicted for a new token."""
+        with self._lock:
+            self._retain(record.fingerprint)
+            self._live.append(record)
+
+    def expire(self, cutoff: datetime) -> None:
+        """Release tracked fingerprints seen before ``cutoff``, whichever user they belong to."""
+        with self._lock:
+            live = self._live
+            while live and live[0].seen_at < cutoff:
+                self._untrack(live.popleft())
+
+    # The helpers below expect the caller to hold ``self._lock``.
+
+    def _retain(self, fingerprint: int) -> None:
+        for token_id in _bit_positions(fingerprint):
+            if not self._refs[token_id]:
+                self._free.pop(token_id, None)
+            self._refs[token_id] += 1
+
+    def _release(self, fingerprint: int) -> None:
+        for token_id in _bit_positions(fingerprint):
+            self._refs[token_id] -= 1
+            if not self._refs[token_id]:
+                self._free[token_id] = None
+
+    def _untrack(self, record: RecentFingerprint) -> None:
+        # Its bits may be reassigned from here on, so it can no longer be matched.
+        record.released = True
+        self._release(record.fingerprint)
+
+
 @dataclass
 class RecentFingerprint:
-    fingerprint: str
-    event: NotificationEvent
+    fingerprint: int
+    type_id: int
     seen_at: datetime
+    fp_id: int = 0
+    size: int = field(init=False)
+    # Set once the vocabulary drops its references; the bits may then mean other tokens.
+    released: bool = field(default=False, init=False)
+
+    def __post_init__(self) -> None:
+        self.size = self.fingerprint.bit_count()
+
+
+@dataclass
+class _EventColumns:
+    """One user's event history as parallel columns sorted by timestamp.
+
+    Rows before ``head`` have expired; they are compacted away once they make up
+    more than half of the columns.
+    """
+
+    timestamps: array[int] = field(default_factory=lambda: array("q"))
+    type_ids: array[int] = field(default_factory=lambda: array("i"))
+    channel_ids: array[int] = field(default_factory=lambda: array("i"))
+    dedupe_keys: list[str | None] = field(default_factory=list)
+    head: int = 0
+
+    def __len__(self) -> int:
+        return len(self.timestamps) - self.head
+
+    def insert(self, ts_us: int, type_id: int, channel_id: int, dedupe_key: str | None) -> None:
+        ts = self.timestamps
+        if len(ts) == self.head or ts[-1] <= ts_us:
+            ts.append(ts_us)
+            self.type_ids.append(type_id)
+            self.channel_ids.append(channel_id)
+            self.dedupe_keys.append(dedupe_key)
+        else:
+            # Caller-supplied timestamps can arrive out of order; keep columns sorted.
+            idx = bisect_right(ts, ts_us, lo=self.head)
+            ts.insert(idx, ts_us)
+            self.type_ids.insert(idx, type_id)
+            self.channel_ids.insert(idx, channel_id)
+            self.dedupe_keys.insert(idx, dedupe_key)
+
+    def index_since(self, cutoff_us: int) -> int:
+        return bisect_left(self.timestamps, cutoff_us, lo=self.head)
+
+    def count_since(self, cutoff_us: int) -> int:
+        return len(self.timestamps) - self.index_since(cutoff_us)
+
+    def expire(self, cutoff_us: int) -> None:
+        self.head = self.index_since(cutoff_us)
+        if self.head * 2 > len(self.timestamps):
+            del self.timestamps[: self.head]
+            del self.type_ids[: self.head]
+            del self.channel_ids[: self.head]
+            del self.dedupe_keys[: self.head]
+            self.head = 0
+
+
+@dataclass
+class _Shard:
+    """Per-user state for the users hashing to one shard, guarded by its own lock."""
+
+    lock: RLock = field(default_factory=RLock)
+    events_by_user: dict[str, _EventColumns] = field(default_factory=lambda: defaultdict(_EventColumns))
+    # Full events for the history UI, sorted by timestamp, kept for _FULL_EVENT_RETENTION.
+    full_events_by_user: dict[str, deque[NotificationEventCore]] = field(
+        default_factory=lambda: defaultdict(deque)
+    )
+    audit_by_user: dict[str, deque[AuditRecord]] = field(default_factory=lambda: defaultdict(deque))
+    fingerprints_by_user: dict[str, deque[RecentFingerprint]] = field(
+        default_factory=lambda: defaultdict(deque)
+    )
+    # Inverted index over fingerprint tokens: token_id -> fp_ids, oldest first.
+    posting_by_user: dict[str, dict[int, deque[int]]] = field(default_factory=lambda: defaultdict(dict))
+    fp_by_id: dict[str, dict[int, RecentFingerprint]] = field(default_factory=lambda: defaultdict(dict))
+    exact_seen: dict[tuple[str, str], datetime] = field(default_factory=dict)
+    # Min-heap of (expires_at, key, seen_at) used to evict exact_seen entries lazily.
+    exact_heap: list[tuple[datetime, tuple[str, str], datetime]] = field(default_factory=list)
+    # Latest delivered timestamp per (user_id, channel_id) for cooldown checks.
+    last_by_channel: dict[str, dict[int, datetime]] = field(default_factory=lambda: defaultdict(dict))
+    # Timestamps of delivered promotional events per user, sorted and trimmed to the daily cap.
+    promo_by_user: dict[str, deque[datetime]] = field(default_factory=lambda: defaultdict(deque))
 
 
 class InMemoryStore:
-    """State store suitable for demos/tests. Swap with Redis or DB in production."""
+    """State store suitable for demos/tests. Swap with Redis or DB in production.
+
+    User state is split across shards by ``hash(user_id)``, each with its own lock,
+    so concurrent decisions for unrelated users do not contend.
+    """
 
     def __init__(self) -> None:
-        self._rules = RuleConfig()
-        self._events_by_user: dict[str, deque[NotificationEvent]] = defaultdict(deque)
-        self._audit_by_user: dict[str, deque[AuditRecord]] = defaultdict(deque)
-        self._fingerprints_by_user: dict[str, deque[RecentFingerprint]] = defaultdict(deque)
-        self._exact_seen: dict[tuple[str, str], datetime] = {}
+        self.set_rules(RuleConfig())
+        self._shards = tuple(_Shard() for _ in range(_SHARD_COUNT))
+        self._fp_ids = count()
+        self.vocabulary = TokenVocabulary()
+        # Event types and channels are stored as small ints; the lists map ids back.
+        self._intern_lock = Lock()
+        self._type_interner: dict[str, int] = {}
+        self._type_names: list[str] = []
+        self._channel_interner: dict[str, int] = {}
+        self._channel_names: list[str] = []
+
+    def _shard(self, user_id: str) -> _Shard:
+        return self._shards[hash(user_id) & (_SHARD_COUNT - 1)]
+
+    def locked(self, user_id: str) -> RLock:
+        """Lock guarding ``user_id``'s state; hold it to make several calls atomic."""
+        return self._shard(user_id).lock
+
+    def _intern(self, table: dict[str, int], names: list[str], value: str) -> int:
+        ident = table.get(value)
+        if ident is None:
+            with self._intern_lock:
+                ident = table.get(value)
+                if ident is None:
+                    ident = len(names)
+                    names.append(value)
+                    table[value] = ident
+        return ident
+
+    def event_type_id(self, event_type: str) -> int:
+        return self._intern(self._type_interner, self._type_names, event_type)
+
+    def channel_id(self, channel: str) -> int:
+        return self._intern(self._channel_interner, self._channel_names, channel)
+
+    def _reassemble(self, user_id: str, cols: _EventColumns, row: int) -> NotificationEventCore:
+        return NotificationEventCore(
+            user_id=user_id,
+            event_type=self._type_names[cols.type_ids[row]],
+            channel=self._channel_names[cols.channel_ids[row]],
+            timestamp=_EPOCH + timedelta(microseconds=cols.timestamps[row]),
+            dedupe_key=cols.dedupe_keys[row],
+        )
 
     def get_rules(self) -> RuleConfig:
         return self._rules
 
     def set_rules(self, rules: RuleConfig) -> RuleConfig:
+        # Frozen mirrors of the event-type lists for O(1) membership tests.
+        self._rule_sets = (
+            frozenset(rules.suppress_event_types),
+            frozenset(rules.promotional_event_types),
+            frozenset(rules.urgent_event_types),
+        )
         self._rules = rules
         return self._rules
 
-    def add_event(self, event: NotificationEvent) -> None:
-        q = self._events_by_user[event.user_id]
-        q.append(event)
-        self._trim_events(event.user_id)
+    def rule_sets(self) -> tuple[frozenset[str], frozenset[str], frozenset[str]]:
+        """Return the (suppress, promotional, urgent) event-type sets for the current rules."""
+        return self._rule_sets
+
+    def tracked_user_count(self) -> int:
+        return sum(len(shard.events_by_user) for shard in self._shards)
+
+    def audit_user_count(self) -> int:
+        return sum(len(shard.audit_by_user) for shard in self._shards)
+
+    def add_event(self, event: NotificationEventCore, now: datetime | None = None) -> None:
+        now = now or utc_now()
+        channel_id = self.channel_id(event.channel)
+        type_id = self.event_type_id(event.event_type)
+        shard = self._shard(event.user_id)
+        with shard.lock:
+            shard.events_by_user[event.user_id].insert(
+                _epoch_us(event.timestamp), type_id, channel_id, event.dedupe_key
+            )
+            self._trim_events(shard, event.user_id, now)
+            full = shard.full_events_by_user[event.user_id]
+            if not full or full[-1].timestamp <= event.timestamp:
+                full.append(event)
+            else:
+                insort(full, event, key=attrgetter("timestamp"))
+            full_cutoff = now - _FULL_EVENT_RETENTION
+            while full and full[0].timestamp < full_cutoff:
+                full.popleft()
+            last_by_channel = shard.last_by_channel[event.user_id]
+            last = last_by_channel.get(channel_id)
+            if last is None or event.timestamp > last:
+                last_by_channel[channel_id] = event.timestamp
+            if event.event_type in self._rule_sets[1]:
+                self._record_promo(shard.promo_by_user[event.user_id], event.timestamp, now)
 
     def add_audit(self, user_id: str, record: AuditRecord) -> None:
-        q = self._audit_by_user[user_id]
-        q.append(record)
-        self._trim_audit(user_id)
+        shard = self._shard(user_id)
+        with shard.lock:
+            shard.audit_by_user[user_id].append(record)
+            self._trim_audit(shard, user_id)
+
+    def recent_events(
+        self, user_id: str, within_seconds: int, now: datetime | None = None
+    ) -> list[NotificationEventCore]:
+        """Events in the window, sorted by timestamp.
 
-    def recent_events(self, user_id: str, within_seconds: int) -> list[NotificationEvent]:
-        self._trim_events(user_id)
-        cutoff = utc_now() - timedelta(seconds=within_seconds)
-        return [ev for ev in self._events_by_user[user_id] if ev.timestamp >= cutoff]
+        Events older than ``_FULL_EVENT_RETENTION`` are rebuilt from compact records
+        and carry no title, message or expiry.
+        """
+        now = now or utc_now()
+        cutoff = now - timedelta(seconds=within_seconds)
+        full_cutoff = max(cutoff, now - _FULL_EVENT_RETENTION)
+        shard = self._shard(user_id)
+        with shard.lock:
+            cols = shard.events_by_user[user_id]
+            start = cols.index_since(_epoch_us(cutoff))
+            stop = max(start, cols.index_since(_epoch_us(full_cutoff)))
+            older = [self._reassemble(user_id, cols, row) for row in range(start, stop)]
+            return older + [
+                ev for ev in shard.full_events_by_user[user_id] if ev.timestamp >= full_cutoff
+            ]
+
+    def scan_for_limits(
+        self,
+        user_id: str,
+        hour_seconds: int,
+        cooldown_seconds: int,
+        channel: str,
+        limit: int,
+        now: datetime | None = None,
+    ) -> tuple[int, bool]:
+        """Return (events within ``hour_seconds`` capped at ``limit``, channel in cooldown) in one call."""
+        now = now or utc_now()
+        cutoff_us = _epoch_us(now - timedelta(seconds=hour_seconds))
+        shard = self._shard(user_id)
+        with shard.lock:
+            cols = shard.events_by_user.get(user_id)
+            hour_count = min(cols.count_since(cutoff_us), limit) if cols else 0
+            channel_id = self._channel_interner.get(channel)
+            last = None if channel_id is None else shard.last_by_channel.get(user_id, {}).get(channel_id)
+        channel_hit = last is not None and last >= now - timedelta(seconds=cooldown_seconds)
+        return hour_count, channel_hit
+
+    def promo_count_within(
+        self, user_id: str, within_seconds: int, limit: int, now: datetime | None = None
+    ) -> int:
+        """Count promotional deliveries newer than the cutoff, capped at ``limit``."""
+        cutoff = (now or utc_now()) - timedelta(seconds=within_seconds)
+        shard = self._shard(user_id)
+        with shard.lock:
+            q = shard.promo_by_user.get(user_id)
+            if not q:
+                return 0
+            # At most promotional_cap_per_day entries, so bisecting the deque is cheap.
+            return min(len(q) - bisect_left(q, cutoff), limit)
 
     def recent_audit(self, user_id: str, limit: int = 50) -> list[AuditRecord]:
-        self._trim_audit(user_id)
-        return list(self._audit_by_user[user_id])[-limit:]
+        shard = self._shard(user_id)
+        with shard.lock:
+            self._trim_audit(shard, user_id)
+            return list(shard.audit_by_user[user_id])[-limit:]
 
     def mark_exact_seen(self, user_id: str, key: str, seen_at: datetime) -> None:
-        self._exact_seen[(user_id, key)] = seen_at
+        dedupe_key = (user_id, key)
+        cooldown = timedelta(seconds=self._rules.cooldown_seconds)
+        shard = self._shard(user_id)
+        with shard.lock:
+            shard.exact_seen[dedupe_key] = seen_at
+            heap = shard.exact_heap
+            heappush(heap, (seen_at + cooldown, dedupe_key, seen_at))
+            while heap and heap[0][0] < seen_at:
+                _, old_key, old_seen_at = heappop(heap)
+                # Skip entries superseded by a later mark of the same key.
+                if shard.exact_seen.get(old_key) != old_seen_at:
+                    continue
+                # The cooldown may have been raised since the key was marked.
+                if old_seen_at + cooldown >= seen_at:
+                    heappush(heap, (old_seen_at + cooldown, old_key, old_seen_at))
+                else:
+                    del shard.exact_seen[old_key]
 
-    def exact_seen_within(self, user_id: str, key: str, within_seconds: int) -> bool:
-        seen_at = self._exact_seen.get((user_id, key))
+    def exact_seen_within(
+        self, user_id: str, key: str, within_seconds: int, now: datetime | None = None
+    ) -> bool:
+        shard = self._shard(user_id)
+        with shard.lock:
+            seen_at = shard.exact_seen.get((user_id, key))
         if not seen_at:
             return False
-        return seen_at >= utc_now() - timedelta(seconds=within_seconds)
-
-    def push_fingerprint(self, user_id: str, fingerprint: str, event: NotificationEvent, seen_at: datetime) -> None:
-        q = self._fingerprints_by_user[user_id]
-        q.append(RecentFingerprint(fingerprint=fingerprint, event=event, seen_at=seen_at))
-        self._trim_fingerprints(user_id)
-
-    def recent_fingerprints(self, user_id: str, within_seconds: int) -> list[RecentFingerprint]:
-        self._trim_fingerprints(user_id)
-        cutoff = utc_now() - timedelta(seconds=within_seconds)
-        return [fp for fp in self._fingerprints_by_user[user_id] if fp.seen_at >= cutoff]
-
-    def _trim_events(self, user_id: str) -> None:
-        cutoff = utc_now() - timedelta(days=2)
-        q = self._events_by_user[user_id]
-        while q and q[0].timestamp < cutoff:
+        return seen_at >= (now or utc_now()) - timedelta(seconds=within_seconds)
+
+    def push_fingerprint(self, user_id: str, fingerprint: int, event: NotificationEventCore, seen_at: datetime) -> None:
+        recent_fp = RecentFingerprint(
+            fingerprint=fingerprint,
+            type_id=self.event_type_id(event.event_type),
+            seen_at=seen_at,
+            fp_id=next(self._fp_ids),
+        )
+        shard = self._shard(user_id)
+        with shard.lock:
+            shard.fingerprints_by_user[user_id].append(recent_fp)
+            shard.fp_by_id[user_id][recent_fp.fp_id] = recent_fp
+            self.vocabulary.track(recent_fp)
+            postings = shard.posting_by_user[user_id]
+            for token_id in _bit_positions(fingerprint):
+                postings.setdefault(token_id, deque()).append(recent_fp.fp_id)
+            self._trim_fingerprints(shard, user_id, seen_at)
+        # Idle users never trim their own fingerprints; expire them store-wide.
+        self.vocabulary.expire(seen_at - _FINGERPRINT_RETENTION)
+
+    def candidate_fingerprints(
+        self, user_id: str, fingerprint: int, within_seconds: int, now: datetime | None = None
+    ) -> list[RecentFingerprint]:
+        """Recent fingerprints sharing at least one token with ``fingerprint``, oldest first."""
+        cutoff = (now or utc_now()) - timedelta(seconds=within_seconds)
+        shard = self._shard(user_id)
+        with shard.lock:
+            postings = shard.posting_by_user[user_id]
+            fp_ids: set[int] = set()
+            for token_id in _bit_positions(fingerprint):
+                posting = postings.get(token_id)
+                if posting:
+                    fp_ids.update(posting)
+            if not fp_ids:
+                return []
+            by_id = shard.fp_by_id[user_id]
+            return [
+                by_id[i] for i in sorted(fp_ids) if by_id[i].seen_at >= cutoff and not by_id[i].released
+            ]
+
+    def _record_promo(self, q: deque[datetime], ts: datetime, now: datetime) -> None:
+        if not q or q[-1] <= ts:
+            q.append(ts)
+        else:
+            insort(q, ts)
+        # Only the newest cap-many deliveries inside the window can affect the cap check.
+        cutoff = now - _PROMO_WINDOW
+        while q and q[0] < cutoff:
+            q.popleft()
+        while len(q) > self._rules.promotional_cap_per_day:
             q.popleft()
 
-    def _trim_audit(self, user_id: str) -> None:
-        cutoff = utc_now() - timedelta(days=7)
-        q = self._audit_by_user[user_id]
+    # The _trim_* helpers expect the caller to hold ``shard.lock``.
+
+    def _trim_events(self, shard: _Shard, user_id: str, now: datetime | None = None) -> None:
+        cutoff = (now or utc_now()) - timedelta(days=2)
+        shard.events_by_user[user_id].expire(_epoch_us(cutoff))
+        # Last-seen channels older than the event history can no longer be in cooldown.
+        last_by_channel = shard.last_by_channel.get(user_id)
+        if last_by_channel:
+            for channel_id in [c for c, ts in last_by_channel.items() if ts < cutoff]:
+                del last_by_channel[channel_id]
+
+    def _trim_audit(self, shard: _Shard, user_id: str, now: datetime | None = None) -> None:
+        cutoff = (now or utc_now()) - timedelta(days=7)
+        q = shard.audit_by_user[user_id]
         while q and q[0].created_at < cutoff:
             q.popleft()
 
-    def _trim_fingerprints(self, user_id: str) -> None:
-        cutoff = utc_now() - timedelta(hours=6)
-        q = self._fingerprints_by_user[user_id]
+    def _trim_fingerprints(self, shard: _Shard, user_id: str, now: datetime | None = None) -> None:
+        cutoff = (now or utc_now()) - _FINGERPRINT_RETENTION
+        q = shard.fingerprints_by_user[user_id]
+        by_id = shard.fp_by_id[user_id]
+        postings = shard.posting_by_user[user_id]
         while q and q[0].seen_at < cutoff:
-            q.popleft()
\ No newline at end of file
+            expired = q.popleft()
+            # The vocabulary releases its bits on its own schedule (TokenVocabulary.expire).
+            del by_id[expired.fp_id]
+            # Fingerprints expire oldest first, so the expired id normally heads its postings.
+            for token_id in _bit_positions(expired.fingerprint):
+                posting = postings[token_id]
+                if posting[0] == expired.fp_id:
+                    posting.popleft()
+                else:
+                    posting.remove(expired.fp_id)
+                if not posting:
+                    del postings[token_id]
@@ -1,8 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
-from app.engine import PrioritizationEngine
-from app.models import Decision, NotificationEvent, RuleConfig
-from app.store import InMemoryStore
+from app.engine import PrioritizationEngine, _FingerprintCache, first_near_duplicate
+from app.models import Decision, NotificationEvent, NotificationEventCore, RuleConfig
+from app.store import InMemoryStore, RecentFingerprint, TokenVocabulary, _epoch_us
 
 
 def mk_event(**kwargs):
@@ -56,3 +57,152 @@ def test_expired_event_is_never() -> None:
     engine = PrioritizationEngine(store)
     e = mk_event(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
     assert engine.decide(e).decision == Decision.NEVER
+
+
+def test_candidate_fingerprints_share_a_token() -> None:
+    store = InMemoryStore()
+    now = datetime.now(timezone.utc)
+    ev1 = NotificationEventCore(user_id="u1", event_type="update", channel="push", timestamp=now)
+    ev2 = NotificationEventCore(user_id="u2", event_type="update", channel="push", timestamp=now)
+    fp_ab = store.vocabulary.fingerprint(["a", "b"])
+    store.push_fingerprint("u1", fp_ab, ev1, now)
+    store.push_fingerprint("u1", store.vocabulary.fingerprint(["c"]), ev1, now)
+    store.push_fingerprint("u2", store.vocabulary.fingerprint(["a"]), ev2, now)
+    query = store.vocabulary.fingerprint(["a"])
+    candidates = store.candidate_fingerprints("u1", query, within_seconds=60)
+    assert [c.fingerprint for c in candidates] == [fp_ab]
+
+
+def test_first_near_duplicate_applies_bounds() -> None:
+    now = datetime.now(timezone.utc)
+    far = RecentFingerprint(fingerprint=0b1, type_id=1, seen_at=now)
+    close = RecentFingerprint(fingerprint=0b1111_1111_1110, type_id=1, seen_at=now)
+    query = 0b1111_1111_1111
+    assert first_near_duplicate(query, 1, [far, close]) is close
+    assert first_near_duplicate(query, 2, [far, close]) is None
+
+
+def test_concurrent_exact_duplicates_deliver_once() -> None:
+    store = InMemoryStore()
+    engine = PrioritizationEngine(store)
+    ev = mk_event(dedupekey="same")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        decisions = list(pool.map(lambda _: engine.decide(ev).decision, range(32)))
+    assert decisions.count(Decision.NOW) == 1
+
+
+def test_recent_events_with_out_of_order_timestamps() -> None:
+    store = InMemoryStore()
+    now = datetime.now(timezone.utc)
+    store.add_event(NotificationEventCore(user_id="u1", event_type="a", channel="push", timestamp=now))
+    old = NotificationEventCore(
+        user_id="u1", event_type="b", channel="push", timestamp=now - timedelta(hours=2)
+    )
+    store.add_event(old)
+    hourly, _ = store.scan_for_limits("u1", 3600, 0, "push", limit=10, now=now)
+    assert hourly == 1
+    assert [ev.event_type for ev in store.recent_events("u1", 3 * 3600, now=now)] == ["b", "a"]
+
+
+def test_near_duplicate_ignores_punctuation() -> None:
+    store = InMemoryStore()
+    store.set_rules(RuleConfig(cooldown_seconds=0))
+    engine = PrioritizationEngine(store)
+    e1 = mk_event(eventtype="update", title="Order update", message="Your order has shipped!")
+    e2 = mk_event(eventtype="update", title="Order update:", message="your order has shipped")
+    assert engine.decide(e1).decision == Decision.NOW
+    d2 = engine.decide(e2)
+    assert d2.decision == Decision.LATER
+    assert d2.reason == "near_duplicate"
+
+
+def test_exact_seen_entries_expire_after_cooldown() -> None:
+    store = InMemoryStore()
+    store.set_rules(RuleConfig(cooldown_seconds=60))
+    t0 = datetime.now(timezone.utc)
+    store.mark_exact_seen("u1", "a", t0)
+    assert store.exact_seen_within("u1", "a", 60, now=t0)
+    store.mark_exact_seen("u1", "b", t0 + timedelta(seconds=120))
+    assert not store.exact_seen_within("u1", "a", 3600, now=t0 + timedelta(seconds=120))
+
+
+def test_near_duplicate_survives_vocabulary_churn() -> None:
+    store = InMemoryStore()
+    store.set_rules(RuleConfig(cooldown_seconds=0))
+    engine = PrioritizationEngine(store)
+    payload = {"eventtype": "update", "title": "Delivery Update", "message": "Your order has shipped"}
+    assert engine.decide(mk_event(**payload)).decision == Decision.NOW
+    # Unreferenced tokens cycle through every free bit without touching the live ones.
+    for i in range(4100):
+        engine._fingerprints.get(f"tok{i}")
+    d = engine.decide(mk_event(**payload))
+    assert d.decision == Decision.LATER
+    assert d.reason == "near_duplicate"
+
+
+def test_vocabulary_only_recycles_unreferenced_bits() -> None:
+    vocab = TokenVocabulary(max_ids=2)
+    live = vocab.fingerprint(["a", "b"])
+    vocab.retain(live)
+    # No free bit and nothing tracked to evict: the token is left out.
+    assert vocab.fingerprint(["c"]) == 0
+    vocab.release(live)
+    # Freed bits are reused instead of widening the mask, and stay distinct per token.
+    reused = vocab.fingerprint(["d", "e", "f"])
+    assert reused.bit_count() == 2
+    assert len(vocab._tokens) == 2
+
+
+def test_vocabulary_width_stays_capped_for_idle_users() -> None:
+    store = InMemoryStore()
+    store.vocabulary = TokenVocabulary(max_ids=64)
+    now = datetime.now(timezone.utc)
+    for i in range(500):
+        fp = store.vocabulary.fingerprint([f"a{i}", f"b{i}"])
+        event = NotificationEventCore(user_id=f"idle{i}", event_type="update", channel="push", timestamp=now)
+        store.push_fingerprint(f"idle{i}", fp, event, now)
+    assert len(store.vocabulary._tokens) <= 64
+    # The oldest fingerprints gave up their bits; the newest are still matchable.
+    assert store.candidate_fingerprints("idle0", fp, within_seconds=60) == []
+    assert [c.fingerprint for c in store.candidate_fingerprints("idle499", fp, within_seconds=60)] == [fp]
+
+
+def test_fingerprint_cache_recomputes_only_reassigned_entries() -> None:
+    vocab = TokenVocabulary(max_ids=2)
+    cache = _FingerprintCache(vocab)
+    a = cache.get("a")
+    b = cache.get("b")
+    vocab.retain(b)
+    c = cache.get("c")  # takes a's unreferenced bit
+    assert c == a
+    vocab.retain(c)
+    assert cache.get("b") == b
+    # Revalidated once; later hits take the fast path.
+    assert cache._entries["b"] == (b, vocab.generation)
+    assert cache.get("a") & (b | c) == 0
+
+
+def test_last_seen_channels_expire_with_event_history() -> None:
+    store = InMemoryStore()
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=3)
+    store.add_event(NotificationEventCore(user_id="u1", event_type="a", channel="email", timestamp=old))
+    store.add_event(NotificationEventCore(user_id="u1", event_type="a", channel="push", timestamp=now))
+    _, channel_hit = store.scan_for_limits("u1", 3600, 7 * 86400, "email", limit=10, now=now)
+    assert not channel_hit
+
+
+def test_exact_seen_entries_follow_raised_cooldown() -> None:
+    store = InMemoryStore()
+    store.set_rules(RuleConfig(cooldown_seconds=60))
+    t0 = datetime.now(timezone.utc)
+    store.mark_exact_seen("u1", "a", t0)
+    store.set_rules(RuleConfig(cooldown_seconds=600))
+    later = t0 + timedelta(seconds=120)
+    store.mark_exact_seen("u1", "b", later)
+    assert store.exact_seen_within("u1", "a", 600, now=later)
+
+
+def test_epoch_us_is_exact_before_the_epoch() -> None:
+    ts = datetime(1969, 12, 31, 23, 59, 59, 500_001, tzinfo=timezone.utc)
+    assert _epoch_us(ts) == -499_999
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import AIAdvisor, app
+
+client = TestClient(app)
+DECIDE = "/v1/notifications/decide"
+
+
+def mk_payload(**kwargs):
+    base = {
+        "userid": "api-user",
+        "eventtype": "reminder",
+        "message": "Stand-up in 5 minutes",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "push",
+    }
+    base.update(kwargs)
+    return base
+
+
+def error_of(response) -> dict:
+    assert response.status_code == 422
+    return response.json()["detail"][0]
+
+
+def test_decide_maps_aliases() -> None:
+    payload = mk_payload(userid="api-alias", dedupekey="k1")
+    first = client.post(DECIDE, json=payload)
+    assert first.status_code == 200
+    assert first.json()["decision"] == "Now"
+    # The aliased dedupekey reached the engine, so the replay is an exact duplicate.
+    second = client.post(DECIDE, json=payload)
+    assert second.json()["reason"] == "exact_duplicate"
+
+
+def test_decide_missing_field() -> None:
+    payload = mk_payload()
+    del payload["userid"]
+    err = error_of(client.post(DECIDE, json=payload))
+    assert err["type"] == "missing"
+    assert err["loc"] == ["body", "userid"]
+
+
+def test_decide_bad_json() -> None:
+    err = error_of(client.post(DECIDE, content=b"{not json", headers={"content-type": "application/json"}))
+    assert err["type"] == "json_invalid"
+
+
+def test_decide_non_object_body() -> None:
+    err = error_of(client.post(DECIDE, json=[mk_payload()]))
+    assert err["type"] == "model_attributes_type"
+
+
+def test_decide_wrong_typed_fields() -> None:
+    err = error_of(client.post(DECIDE, json=mk_payload(eventtype=["x"])))
+    assert (err["type"], err["loc"]) == ("string_type", ["body", "eventtype"])
+    err = error_of(client.post(DECIDE, json=mk_payload(title=5)))
+    assert (err["type"], err["loc"]) == ("string_type", ["body", "title"])
+    err = error_of(client.post(DECIDE, json=mk_payload(metadata=[1])))
+    assert err["type"] == "dict_type"
+
+
+def test_decide_rejects_long_dedupe_key() -> None:
+    err = error_of(client.post(DECIDE, json=mk_payload(dedupekey="k" * 257)))
+    assert err["loc"] == ["body", "dedupekey"]
+
+
+def test_decide_accepts_epoch_and_numeric_string_timestamps() -> None:
+    for i, ts in enumerate([int(time.time() * 1000), int(time.time()), str(int(time.time()))]):
+        response = client.post(DECIDE, json=mk_payload(userid=f"api-epoch{i}", timestamp=ts))
+        assert response.status_code == 200
+        assert response.json()["decision"] == "Now"
+
+
+def test_decide_rejects_out_of_range_timestamps() -> None:
+    err = error_of(client.post(DECIDE, json=mk_payload(timestamp=10**30)))
+    assert (err["type"], err["loc"]) == ("datetime_parsing", ["body", "timestamp"])
+    err = error_of(client.post(DECIDE, json=mk_payload(expires_at="not a date")))
+    assert err["loc"] == ["body", "expires_at"]
+
+
+class SlowAdvisor(AIAdvisor):
+    def suggest(self, event):
+        time.sleep(0.2)
+        return super().suggest(event)
+
+
+def test_decide_appends_advisor_hint(monkeypatch) -> None:
+    monkeypatch.setattr(main, "advisor", AIAdvisor(enabled=True, timeout_ms=5000))
+    response = client.post(DECIDE, json=mk_payload(userid="api-advisor"))
+    assert response.json()["reason"] == "passed_all_checks;ai_hint:reminder"
+
+
+def test_decide_falls_back_when_advisor_times_out(monkeypatch) -> None:
+    monkeypatch.setattr(main, "advisor", SlowAdvisor(enabled=True, timeout_ms=10))
+    response = client.post(DECIDE, json=mk_payload(userid="api-advisor-slow"))
+    assert response.status_code == 200
+    assert response.json()["reason"] == "passed_all_checks;ai_unavailable_timeout_fallback_to_rules"